@@ -0,0 +1,197 @@
+"""
+Admission control and scheduling of concurrent WebSocket sessions (e.g. PACE handshakes) in front of their Worker threads.
+
+Two limits are enforced:
+- maxSessions: number of admitted sessions, which are in progress (e.g. mid-handshake) at the same time
+- maxActive: number of admitted sessions running server side code at the same time. A session gives up its slot while waiting for the card's response (suspend) and asks for it again afterwards (resume).
+
+Sessions resuming after a card response are always served before new sessions. New sessions wait in a bounded queue with a deadline; if the queue is full or the deadline passes, the session is rejected and the client is expected to retry later.
+
+Usage:
+    scheduler = Scheduler(maxSessions=4, maxActive=2, maxQueued=8, queueTimeout=10)
+    ticket = scheduler.enqueue() #non-blocking, None if rejected
+    if scheduler.wait(ticket):   #blocks until admitted, False if deadline passed or cancelled
+        try:
+            ...                  #compute
+            scheduler.suspend()  #wait for card
+            scheduler.resume()   #always pair with suspend(), also on error, before finish()
+            ...
+        finally:
+            scheduler.finish()   #releases the slot, so the session must hold it (not be suspended)
+    scheduler.cancel(ticket)     #e.g. client closed while queued, wait() returns False
+
+Run `python3 Scheduler.py` to self-test.
+"""
+import threading
+import heapq
+import itertools
+import time
+
+PRIORITY_HANDSHAKE = 0 #admitted session resuming after a card response
+PRIORITY_NEW = 1 #session waiting for admission
+
+BUSY = "busy" #rejection message sent to the client, which may retry
+
+#place in the queue, ordered by priority and arrival
+class Ticket:
+    def __init__(self, priority, sequence, deadline):
+        self.priority = priority
+        self.sequence = sequence
+        self.deadline = deadline #monotonic time, None to wait without limit
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+class Scheduler:
+    def __init__(self, maxSessions=4, maxActive=2, maxQueued=8, queueTimeout=10.0):
+        self.maxSessions = maxSessions
+        self.maxActive = maxActive
+        self.maxQueued = maxQueued
+        self.queueTimeout = queueTimeout #seconds a new session may wait for admission
+
+        self.condition = threading.Condition()
+        self.waiting = [] #heap of tickets
+        self.sequence = itertools.count() #FIFO order within a priority
+        self.queued = 0 #new sessions waiting for admission
+        self.sessions = 0 #admitted and unfinished sessions
+        self.active = 0 #sessions holding a slot
+
+    #queue a new session without blocking, returns a ticket or None if the queue is full
+    def enqueue(self):
+        with self.condition:
+            if self.queued >= self.maxQueued:
+                return None
+            self.queued += 1
+            return self._push(PRIORITY_NEW, time.monotonic() + self.queueTimeout)
+
+    #block until the ticket is admitted (True) or its deadline passed (False)
+    def wait(self, ticket):
+        with self.condition:
+            try:
+                return self._acquire(ticket)
+            finally:
+                if ticket.priority == PRIORITY_NEW:
+                    self.queued -= 1
+
+    #drop a ticket still waiting for admission, no-op once admitted
+    def cancel(self, ticket):
+        with self.condition:
+            ticket.cancelled = True
+            self._remove(ticket)
+            self.condition.notify_all()
+
+    #give up the slot of an admitted session, e.g. while waiting for the card
+    def suspend(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+    #get a slot again, ahead of all new sessions
+    def resume(self):
+        with self.condition:
+            self._acquire(self._push(PRIORITY_HANDSHAKE, None))
+
+    #release the slot and the session
+    def finish(self):
+        with self.condition:
+            self.active -= 1
+            self.sessions -= 1
+            self.condition.notify_all()
+
+    def _push(self, priority, deadline):
+        ticket = Ticket(priority, next(self.sequence), deadline)
+        heapq.heappush(self.waiting, ticket)
+        return ticket
+
+    #remove by identity, the ticket may already be admitted
+    def _remove(self, ticket):
+        for i, waiting in enumerate(self.waiting):
+            if waiting is ticket:
+                del self.waiting[i]
+                heapq.heapify(self.waiting)
+                return
+
+    #ticket is served in order of priority and arrival, new sessions additionally need a free session
+    def _grantable(self, ticket):
+        if ticket.cancelled or self.waiting[0] is not ticket: return False
+        if self.active >= self.maxActive: return False
+        if ticket.priority == PRIORITY_NEW and self.sessions >= self.maxSessions: return False
+        return True
+
+    def _acquire(self, ticket):
+        deadline = ticket.deadline
+        while not self._grantable(ticket):
+            if ticket.cancelled: #cancelled, already removed from queue
+                return False
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0: #drop ticket and let the next one move up
+                self._remove(ticket)
+                self.condition.notify_all()
+                return False
+            self.condition.wait(remaining)
+
+        heapq.heappop(self.waiting)
+        self.active += 1
+        if ticket.priority == PRIORITY_NEW:
+            self.sessions += 1
+        self.condition.notify_all() #next ticket may be grantable as well
+        return True
+
+#self-test of ordering, deadlines, cancellation and slot accounting
+if __name__ == "__main__":
+    def waitUntil(condition):
+        for i in range(200):
+            if condition(): return
+            time.sleep(0.01)
+        raise AssertionError("timed out")
+
+    def idle(scheduler):
+        return scheduler.queued == 0 and scheduler.active == 0 and scheduler.sessions == 0 and scheduler.waiting == []
+
+    # resuming session is served before a new session queued earlier
+    scheduler = Scheduler(maxSessions=3, maxActive=1, maxQueued=4, queueTimeout=5)
+    a = scheduler.enqueue(); assert scheduler.wait(a)
+    scheduler.suspend() #a waits for card
+    b = scheduler.enqueue(); assert scheduler.wait(b) #b holds the only slot
+    order = []
+    def admitNew():
+        if scheduler.wait(scheduler.enqueue()): order.append("new"); scheduler.finish()
+    def resumeA():
+        scheduler.resume(); order.append("resume"); scheduler.finish()
+    threads = [threading.Thread(target=admitNew)]
+    threads[0].start(); waitUntil(lambda: len(scheduler.waiting) == 1)
+    threads.append(threading.Thread(target=resumeA))
+    threads[1].start(); waitUntil(lambda: len(scheduler.waiting) == 2)
+    scheduler.finish() #b done, frees the slot
+    for thread in threads: thread.join()
+    assert order == ["resume", "new"], order
+    assert idle(scheduler)
+
+    # deadline expires for a ticket behind the head of the queue
+    scheduler = Scheduler(maxSessions=2, maxActive=1, maxQueued=4, queueTimeout=0.2)
+    a = scheduler.enqueue(); assert scheduler.wait(a)
+    scheduler.suspend()
+    b = scheduler.enqueue(); assert scheduler.wait(b)
+    thread = threading.Thread(target=scheduler.resume) #a resumes at the head, without deadline
+    thread.start(); waitUntil(lambda: len(scheduler.waiting) == 1)
+    c = scheduler.enqueue()
+    assert scheduler.waiting[0] is not c
+    assert not scheduler.wait(c)
+    assert scheduler.queued == 0 and len(scheduler.waiting) == 1
+    scheduler.finish(); thread.join(); scheduler.finish()
+    assert idle(scheduler)
+
+    # queue limit rejects immediately, cancelled ticket is not admitted
+    scheduler = Scheduler(maxSessions=1, maxActive=1, maxQueued=1, queueTimeout=5)
+    a = scheduler.enqueue(); assert scheduler.wait(a)
+    b = scheduler.enqueue()
+    assert scheduler.enqueue() is None
+    result = []
+    thread = threading.Thread(target=lambda: result.append(scheduler.wait(b)))
+    thread.start(); scheduler.cancel(b); thread.join()
+    assert result == [False]
+    scheduler.finish()
+    assert idle(scheduler)
+
+    print("Scheduler self-test passed.")
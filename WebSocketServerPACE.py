@@ -6,6 +6,7 @@ Requires Python(3) and pip packages: pycryptodome, ecdsa, pytlv, git+https://git
 To enable SSL/TLS see [SimpleWebSocketServer] and update wss:// url in demo.html.
 
 Usage: upon WebSocket connection, the client is sent APDUs, to which a response APDU is expected as answer.
+Concurrent handshakes are limited by a Scheduler (see Scheduler.py). If the server is busy, the client is sent "busy" and may retry later.
 
 [SimpleWebSocketServer]: https://github.com/dpallot/simple-websocket-server
 [pypace]: https://github.com/tsenger/pypace
@@ -19,6 +20,10 @@ from SimpleWebSocketServer import SimpleWebSocketServer, WebSocket #python3 -m p
 import threading
 import time
 from Pace import Pace #python3 -m pip install pycryptodome ecdsa pytlv
+from Scheduler import Scheduler, BUSY
+
+scheduler = Scheduler(maxSessions=4, maxActive=2, maxQueued=8, queueTimeout=10) #handshakes in progress, handshakes computing, new handshakes waiting, seconds to wait
+responseTimeout = 10 #seconds to wait for a response APDU, before the handshake is aborted and its session released
 
 class AuthenticationExample(WebSocket):
     def handleMessage(self):    #WebSocket session, included in self is automatically saved and loaded for each request
@@ -30,9 +35,18 @@ class AuthenticationExample(WebSocket):
         if(type(self.data) is str): #received CAN string
             can = self.data
             print(self.address,'received', self.data)
+            if getattr(self,'worker',None) is not None: #handshake of this session still running, not an overload
+                print(self.address,'ignored, handshake already running')
+                return
+            ticket = scheduler.enqueue()
+            if ticket is None: #reject fast, instead of starting another worker
+                print(self.address,'rejected, server busy')
+                self.sendMessage(BUSY)
+                return
             try: #use try-exception to have errors outputted to terminal
                 self.workerEvent = threading.Event()
-                workerThread = Worker(self,can) #starts automatically and does not block SimpleWebSocketServer
+                self.worker = Worker(self,can,ticket)
+                self.worker.start() #does not block SimpleWebSocketServer, started after assignment as run() resets self.worker
             except:
                 print("Unexpected error:", sys.exc_info())
                 raise
@@ -40,9 +54,17 @@ class AuthenticationExample(WebSocket):
 
     def handleConnected(self):
         print(self.address, 'connected')
+        self.disconnected = False
+        self.worker = None
 
     def handleClose(self):
         print(self.address, 'closed')
+        self.disconnected = True
+        worker = getattr(self,'worker',None) #read once, run() may reset it concurrently
+        if worker is not None:
+            scheduler.cancel(worker.ticket) #drop from queue, if not yet admitted
+        if getattr(self,'workerEvent',None) is not None:
+            self.workerEvent.set() #unblock worker, so it can release its session
 
 #pyscard compatible Connection, supporting only transmit
 class Connection:
@@ -57,13 +79,29 @@ class Connection:
 
 #event and shared variable synchronized worker
 class Worker:
-    def __init__(self, websocket, can):
+    def __init__(self, websocket, can, ticket):
         self.websocket = websocket
         self.can = can
-        thread = threading.Thread(target=self.run, args=())
-        thread.start()
+        self.ticket = ticket
+        self.thread = threading.Thread(target=self.run, args=())
+
+    def start(self):
+        self.thread.start()
 
     def run(self):
+        if not scheduler.wait(self.ticket): #queued too long or cancelled
+            print(self.websocket.address,'rejected, admission deadline passed or closed')
+            self.websocket.worker = None
+            if not self.websocket.disconnected: self.websocket.sendMessage(BUSY)
+            return
+        try:
+            if self.websocket.disconnected: return #closed while queued, release session right away
+            self.pace()
+        finally:
+            scheduler.finish()
+            self.websocket.worker = None
+
+    def pace(self):
         connection = Connection(self)
         pace_operator = Pace(connection)
 
@@ -76,14 +114,18 @@ class Worker:
             paceResult = pace_operator.performPACE(pace_oid, bytes(password,'ascii'), pw_ref, chat)
             self.websocket.sendMessage(str(paceResult))
         except:
-            self.websocket.sendMessage("-1") #already established PACE causes exception
+            if not self.websocket.disconnected: self.websocket.sendMessage("-1") #already established PACE causes exception
 
     def transceive(self,msg):
         self.websocket.sendMessage(msg)
 
-        #block worker until websocket receives response
-        self.websocket.workerEvent.wait()
+        #block worker until websocket receives response, meanwhile other handshakes may compute
+        scheduler.suspend()
+        answered = self.websocket.workerEvent.wait(responseTimeout)
         self.websocket.workerEvent.clear() #reset for next event in case of event reuse
+        scheduler.resume() #mid-handshake, served before new sessions
+        if self.websocket.disconnected: raise ConnectionError("WebSocket closed during handshake.")
+        if not answered: raise TimeoutError("No response APDU within %s seconds." % responseTimeout)
 
         #get response from shared variable
         data = self.websocket.responseAPDU
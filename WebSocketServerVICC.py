@@ -7,6 +7,8 @@ Example exchange:
           WebSocket<--vicc<--vpcd<--app<--CAPDU
   RAPDU-->WebSocket-->vicc-->vpcd-->app
 
+Concurrent sessions are limited by a Scheduler (see Scheduler.py). If the server is busy, the client is sent "busy" and may retry later.
+
 [SimpleWebSocketServer]: https://github.com/dpallot/simple-websocket-server
 [vsmartcard]: https://github.com/frankmorgner/vsmartcard
 [https://frankmorgner.github.io/vsmartcard/virtualsmartcard/api.html#virtualsmartcard-api]
@@ -22,6 +24,11 @@ from SimpleWebSocketServer import SimpleWebSocketServer, WebSocket #python3 -m p
 # vsmartcard/virtualsmartcard/src/vpicc/virtualsmartcard folder in site-packages, __pypackages__, current directory, or somewhere in $PATH
 from virtualsmartcard.VirtualSmartcard import SmartcardOS, Iso7816OS, VirtualICC #https://github.com/frankmorgner/vsmartcard/tree/master/virtualsmartcard/src/vpicc/virtualsmartcard
 import threading
+import socket
+from Scheduler import Scheduler, BUSY
+
+scheduler = Scheduler(maxSessions=1, maxActive=1, maxQueued=4, queueTimeout=10) #vpcd serves a single vicc per port
+responseTimeout = 30 #seconds to wait for a response APDU, before the relay is aborted and its session released
 
 class VICCProxy(WebSocket):
     def handleMessage(self):
@@ -33,39 +40,95 @@ class VICCProxy(WebSocket):
         # use string to start the worker and hand over control of the smartcard communication to it
         if(type(self.data) is str): #received string
             print(self.address,'received', self.data)
+            if getattr(self,'worker',None) is not None: #session already relaying, not an overload
+                print(self.address,'ignored, relay already running')
+                return
+            ticket = scheduler.enqueue()
+            if ticket is None: #reject fast, instead of starting another worker
+                print(self.address,'rejected, server busy')
+                self.sendMessage(BUSY)
+                return
             try: #use try-exception to have errors outputted to terminal
                 self.workerEvent = threading.Event()
-                workerThread = Worker(self) #starts automatically and does not block SimpleWebSocketServer
+                self.worker = Worker(self,ticket)
+                self.worker.start() #does not block SimpleWebSocketServer, started after assignment as run() resets self.worker
             except:
                 print("Unexpected error:", sys.exc_info())
                 raise
 
     def handleConnected(self):
         print(self.address, 'connected')
+        self.disconnected = False
+        self.worker = None
 
     def handleClose(self):
         print(self.address, 'closed')
+        self.disconnected = True
+        worker = getattr(self,'worker',None) #read once, run() may reset it concurrently
+        if worker is not None:
+            scheduler.cancel(worker.ticket) #drop from queue, if not yet admitted
+            worker.stop() #break vicc's blocking read from vpcd, so the session is released
+        if getattr(self,'workerEvent',None) is not None:
+            self.workerEvent.set() #unblock worker, so it can release its session
 
 class Worker:
-    def __init__(self, websocket):
+    def __init__(self, websocket, ticket):
         self.websocket = websocket
-        thread = threading.Thread(target=self.run, args=())
-        thread.start()
+        self.ticket = ticket
+        self.vicc = None
+        self.thread = threading.Thread(target=self.run, args=())
+
+    def start(self):
+        self.thread.start()
+
+    #close the vpcd connection, VirtualICC.run() then returns
+    def stop(self):
+        vicc, self.vicc = self.vicc, None #stop once, called from handleClose and run()
+        if vicc is not None:
+            try:
+                vicc.sock.shutdown(socket.SHUT_RDWR) #unlike close(), wakes up a recv blocked in another thread
+            except OSError: #already closed
+                pass
+            vicc.stop()
 
     def run(self):
+        if not scheduler.wait(self.ticket): #queued too long or cancelled
+            print(self.websocket.address,'rejected, admission deadline passed or closed')
+            self.websocket.worker = None
+            if not self.websocket.disconnected: self.websocket.sendMessage(BUSY)
+            return
+        try:
+            if self.websocket.disconnected: return #closed while queued, release session right away
+            self.relay()
+        finally:
+            try:
+                self.stop()
+            finally:
+                scheduler.finish()
+                self.websocket.worker = None
+
+    def relay(self):
         # vpcd is expected to be running on localhost:35963 and handing out CAPDUs (from an application)
         # "VirtualICC provides the connection to the virtual smart card reader. It fetches an APDU and other requests from the vpcd." [https://frankmorgner.github.io/vsmartcard/virtualsmartcard/api.html#virtualsmartcard-api]. App--vpcd--VirtualICC.
-        vicc = VirtualICC(datasetfile=None, card_type='iso7816', host='localhost', port=35963)
-        vicc.os = WebSocketOS(self, self.websocket)
-        vicc.run()
+        self.vicc = VirtualICC(datasetfile=None, card_type='iso7816', host='localhost', port=35963)
+        self.vicc.os = WebSocketOS(self, self.websocket)
+        if self.websocket.disconnected: return #closed while connecting to vpcd, handleClose found no vicc to stop
+        try:
+            self.vicc.run()
+        except (ConnectionError, TimeoutError) as error: #client closed or did not answer, see transceive
+            print(self.websocket.address,'relay aborted:', error)
 
     # send apdu to client and wait for answer apdu from it to return it
     def transceive(self,msg):
         self.websocket.sendMessage(msg)
 
-        #block worker until websocket receives response
-        self.websocket.workerEvent.wait()
+        #block worker until websocket receives response, meanwhile other sessions may run
+        scheduler.suspend()
+        answered = self.websocket.workerEvent.wait(responseTimeout)
         self.websocket.workerEvent.clear() #reset for next event in case of event reuse
+        scheduler.resume() #running session, served before new sessions
+        if self.websocket.disconnected: raise ConnectionError("WebSocket closed during relay.")
+        if not answered: raise TimeoutError("No response APDU within %s seconds." % responseTimeout)
 
         #get response from shared variable
         data = self.websocket.responseAPDU